@@ -14,18 +14,31 @@ NicoNico Tag Monitor (Discord-first + 必須タグ「毎回」通知版)
   VIDEOS="sm9,sm12345678"                                         (監視smID カンマ区切り)
   REQUIRED_TAGS="タグA,タグB"                                     (必須タグ カンマ区切り; 未設定なら無効)
   USER_AGENT="..."                                                (任意)
+  MAX_BODY_BYTES="2097152"                                        (任意: 1ページの読み込み上限)
+  STATE_PRETTY="1"                                                (任意: state.json を整形して保存)
 """
 
 import os
+import re
+import html
+import codecs
 import json
+import hashlib
+import random
+import tempfile
 import time
 import argparse
 import logging
 from pathlib import Path
-from typing import Dict, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
+import httpx
+import orjson
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from selectolax.lexbor import LexborHTMLParser
 
 # .envがあれば読み込む（ローカル用。ActionsではSecretsを環境変数で注入）
 try:
@@ -35,96 +48,405 @@ except Exception:
     pass
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+# httpx はリクエストごとに INFO ログを出すので抑える
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 DEFAULT_HEADERS = {
-    "User-Agent": os.getenv("USER_AGENT", "Mozilla/5.0 (compatible; NicoTagMonitor/1.3)")
+    "User-Agent": os.getenv("USER_AGENT", "Mozilla/5.0 (compatible; NicoTagMonitor/1.3)"),
+    # br は brotli パッケージが入っていれば httpx / urllib3 が展開する
+    "Accept-Encoding": "gzip, deflate, br",
+    "Accept-Language": "ja",
 }
 
+# 再試行の待ち時間に加える揺らぎ（待ち時間に対する割合）。通知・動画取得の両方で共通
+RETRY_JITTER_RATIO = 0.25
+
+def _with_jitter(delay: float) -> float:
+    """待ち時間に 0〜RETRY_JITTER_RATIO の割合の揺らぎを加える。"""
+    return delay * (1 + random.uniform(0, RETRY_JITTER_RATIO))
+
+class _JitteredRetry(Retry):
+    """
+    urllib3 の Retry を _retry_delay と同じ規則にそろえたもの。
+    揺らぎは秒数ではなく待ち時間に対する割合で入れ、Retry-After は DEFAULT_BACKOFF_MAX で頭打ちにする。
+    """
+
+    def get_backoff_time(self) -> float:
+        return _with_jitter(super().get_backoff_time())
+
+    def get_retry_after(self, response) -> Optional[float]:
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, Retry.DEFAULT_BACKOFF_MAX)
+
+# 一時的な失敗（429/5xx/接続断）は指数バックオフで再試行する。
+# Retry-After に従い、複数動画の通知が同時に再送しないよう揺らぎ（jitter）を入れる。
+_RETRY = _JitteredRetry(
+    total=4,
+    backoff_factor=1.0,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset(["GET", "POST"]),
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+
+# watch ページ取得用の HTTP/2 クライアント（全動画の GET を1本の接続に多重化する）。
+# 再試行（429/5xx・通信エラー）はすべて _get_with_retry が _RETRY に合わせて行う。
+_CLIENT = httpx.Client(
+    headers=DEFAULT_HEADERS,
+    timeout=20.0,
+    follow_redirects=True,
+    transport=httpx.HTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=4, max_connections=8),
+    ),
+)
+
+# 通知（Discord/Teams）用の HTTP セッション（keep-alive で TLS ハンドシェイクを省く）
+_SESSION = requests.Session()
+_SESSION.headers.update(DEFAULT_HEADERS)
+_ADAPTER = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=_RETRY)
+_SESSION.mount("https://", _ADAPTER)
+_SESSION.mount("http://", _ADAPTER)
+
+# JSON-LD / og:title をパース前に直接抜き出すための正規表現（_read_body で使う）
+_JSONLD_RE = re.compile(rb'<script[^>]+type="application/ld\+json"[^>]*>(.*?)</script>', re.DOTALL)
+_OG_TITLE_RE = re.compile(rb'<meta[^>]+property="og:title"[^>]+content="([^"]+)"')
+
+# フォールバック用（DOM パース時）の CSS セレクタ
+_OG_TITLE_SELECTOR = 'meta[property="og:title"]'
+_JSONLD_SELECTOR = 'script[type="application/ld+json"]'
+_META_KW_SELECTOR = 'meta[name="keywords"]'
+_TAG_SELECTOR = 'a[data-tag], li a[href*="/tag/"], span.TagContainer-tag'
+
+# 1ページあたりに読み込む本文の上限（バイト）
+MAX_BODY_BYTES = int(os.getenv("MAX_BODY_BYTES", str(2 * 1024 * 1024)))
+
+# state.json の書き出しオプション（STATE_PRETTY=1 で人が読みやすい整形出力）
+_STATE_DUMP_OPTION = orjson.OPT_SORT_KEYS | (orjson.OPT_INDENT_2 if os.getenv("STATE_PRETTY") == "1" else 0)
+
+# Discord webhook の制限（1メッセージあたり）
+DISCORD_MAX_EMBEDS = 10
+DISCORD_MAX_EMBED_CHARS = 6000
+DISCORD_EMBED_DESC_MAX = 4096
+
+# state.json ではなく state.meta.json に分けて保存する、実行ごとに変わる項目
+HOT_STATE_KEYS = frozenset(["last_checked", "etag", "last_modified", "body_sha256"])
+
+# 動画取得の並列数の上限
+MAX_WORKERS = 8
+
 # -------------------- ユーティリティ --------------------
 
 def parse_args():
     ap = argparse.ArgumentParser()
     ap.add_argument("--videos", help="Comma-separated video IDs (e.g., sm9,sm12345). Defaults to VIDEOS env.")
-    ap.add_argument("--state", default="state.json", help="Path to persistent state JSON file.")
+    ap.add_argument("--state", default="state.json", help="Path to persistent state JSON file (per-run fields go to the sibling .meta.json).")
     return ap.parse_args()
 
-def load_state(path: Path) -> Dict[str, Dict]:
-    if path.exists():
-        return json.loads(path.read_text(encoding="utf-8"))
-    return {}
+def meta_state_path(path: Path) -> Path:
+    """毎回更新される項目（HOT_STATE_KEYS）の保存先。state.json → state.meta.json"""
+    return path.with_suffix(".meta.json")
 
-def save_state(path: Path, state: Dict):
-    tmp = path.with_suffix(".tmp")
-    tmp.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
-    tmp.replace(path)
+def load_state(path: Path) -> Tuple[Dict[str, Dict], Tuple[Optional[bytes], Optional[bytes]]]:
+    """
+    state.json と state.meta.json を読み込み、動画IDごとに1つの dict にまとめて返す。
+    あわせて各ファイルの読み込んだままのバイト列（無ければ None）も返す（save_state の比較用）。
+    """
+    state: Dict[str, Dict] = {}
+    raw: List[Optional[bytes]] = []
+    for p in (path, meta_state_path(path)):
+        data = p.read_bytes() if p.exists() else None
+        raw.append(data)
+        if data is not None:
+            for vid, entry in orjson.loads(data).items():
+                state.setdefault(vid, {}).update(entry)
+    return state, (raw[0], raw[1])
+
+def _fsync_dir(path: Path):
+    """ディレクトリを fsync して rename を確定させる（O_DIRECTORY のない Windows では何もしない）。"""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def dump_state(state: Dict) -> Tuple[bytes, bytes]:
+    """state を (state.json の内容, state.meta.json の内容) に分けてシリアライズする。"""
+    main_part: Dict[str, Dict] = {}
+    hot_part: Dict[str, Dict] = {}
+    for vid, entry in state.items():
+        main_part[vid] = {k: v for k, v in entry.items() if k not in HOT_STATE_KEYS}
+        hot_part[vid] = {k: v for k, v in entry.items() if k in HOT_STATE_KEYS}
+    return (
+        orjson.dumps(main_part, option=_STATE_DUMP_OPTION),
+        orjson.dumps(hot_part, option=_STATE_DUMP_OPTION),
+    )
+
+def _atomic_write(path: Path, data: bytes):
+    """
+    同じディレクトリの一意な一時ファイルに書いて fsync → rename → 親ディレクトリを fsync。
+    クラッシュしても旧/新どちらかが残り、同時実行でも一時ファイルが衝突しない。
+    """
+    with tempfile.NamedTemporaryFile(dir=path.parent, prefix=path.name + ".", suffix=".tmp", delete=False) as f:
+        tmp_name = f.name
+        try:
+            # mkstemp は 0600 で作るので、従来どおり他のユーザー/ツールも読める 0644 にする
+            if hasattr(os, "fchmod"):
+                os.fchmod(f.fileno(), 0o644)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        except BaseException:
+            f.close()
+            os.unlink(tmp_name)
+            raise
+    try:
+        os.replace(tmp_name, path)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+    _fsync_dir(path.parent)
 
-def parse_required_tags() -> Set[str]:
+def save_state(path: Path, state: Dict, old_bytes: Optional[Tuple[Optional[bytes], Optional[bytes]]] = None) -> bool:
+    """
+    state を state.json / state.meta.json に分けて保存する。
+    old_bytes（load_state が読んだ各ファイルの中身）と同じファイルは書き込まない。
+    どちらかを書き込んだかどうかを返す。
+    """
+    # タグ側を先に書く（間で落ちても、古い ETag なら次回 200 で取り直すだけで済む）
+    old_bytes = old_bytes or (None, None)
+    written = False
+    for p, data, old in zip((path, meta_state_path(path)), dump_state(state), old_bytes):
+        if data != old:
+            _atomic_write(p, data)
+            written = True
+    return written
+
+def parse_required_tags() -> FrozenSet[str]:
+    # 実行中は変わらないので frozenset で1回だけ作り、全動画で共有する
     raw = os.getenv("REQUIRED_TAGS", "")
     if not raw.strip():
-        return set()
-    return {t.strip() for t in raw.split(",") if t.strip()}
+        return frozenset()
+    return frozenset(t.strip() for t in raw.split(",") if t.strip())
 
 # -------------------- タグ取得 --------------------
 
-def fetch_tags(video_id: str) -> Tuple[Set[str], Dict]:
+def _jsonld_keywords(data) -> Set[str]:
+    """JSON-LD の keywords（リスト or カンマ区切り文字列）をタグ集合にする。"""
+    if not isinstance(data, dict) or "keywords" not in data:
+        return set()
+    kw = data["keywords"]
+    if isinstance(kw, list):
+        return {str(x).strip() for x in kw if str(x).strip()}
+    if isinstance(kw, str):
+        return {t.strip() for t in kw.split(",") if t.strip()}
+    return set()
+
+def _resume_pos(buf: bytearray, pos: int, open_tag: bytes, close_tag: bytes) -> int:
+    """
+    次のチャンクでどこから探し直せばよいかを返す。
+    まだ閉じていない open_tag があればその先頭、なければ末尾（open_tag が途中で切れていても拾える位置）。
+    """
+    last = buf.rfind(open_tag, pos)
+    if last != -1 and buf.find(close_tag, last) == -1:
+        return last
+    return max(pos, len(buf) - len(open_tag) + 1)
+
+def _scan_jsonld(buf: bytearray, pos: int, encoding: str) -> Tuple[Set[str], int]:
+    """
+    pos 以降で閉じた JSON-LD ブロックを順に調べ、keywords が取れたら (タグ, 次の位置) を返す。
+    各ブロックは一度だけ（ページの文字コードでデコードして）json.loads する。
+    """
+    for m in _JSONLD_RE.finditer(buf, pos):
+        pos = m.end()
+        try:
+            tags = _jsonld_keywords(json.loads(m.group(1).decode(encoding, errors="replace")))
+        except Exception:
+            continue
+        if tags:
+            return tags, pos
+    return set(), _resume_pos(buf, pos, b"<script", b"</script>")
+
+def _scan_og_title(buf: bytearray, pos: int, encoding: str) -> Tuple[Optional[str], int]:
+    """pos 以降から og:title を探し、(ページの文字コードでデコードしたタイトル or None, 次の位置) を返す。"""
+    m = _OG_TITLE_RE.search(buf, pos)
+    if m:
+        return html.unescape(m.group(1).decode(encoding, errors="replace")), m.end()
+    return None, _resume_pos(buf, pos, b"<meta", b">")
+
+def _retry_delay(attempt: int, retry_after: Optional[str]) -> float:
+    """
+    再試行までの待ち時間。Retry-After があればそれに従い、なければ指数バックオフ＋揺らぎ（0〜25%）。
+    どちらも Retry.DEFAULT_BACKOFF_MAX で頭打ちにして、ワーカーが長時間止まらないようにする。
+    """
+    if retry_after:
+        try:
+            return min(_RETRY.parse_retry_after(retry_after), Retry.DEFAULT_BACKOFF_MAX)
+        except Exception:
+            pass
+    backoff = min(_RETRY.backoff_factor * (2 ** attempt), Retry.DEFAULT_BACKOFF_MAX)
+    return _with_jitter(backoff)
+
+def _get_with_retry(url: str, headers: Dict[str, str]) -> Tuple[httpx.Response, bytes, Optional[Tuple[Set[str], str]]]:
+    """
+    GET して (応答, 本文, _read_body の高速抽出結果) を返す。本文は 2xx のときだけ読む（それ以外は b""）。
+    429/5xx と通信エラー（接続失敗・接続断・読み込みタイムアウトなど。本文の途中も含む）は
+    _RETRY と同じ回数まで待って再試行する。回数を使い切ったら最後の応答を返すか、例外をそのまま投げる。
+    """
+    attempt = 0
+    while True:
+        retry_after = None
+        try:
+            resp = _CLIENT.send(_CLIENT.build_request("GET", url, headers=headers), stream=True)
+            try:
+                if resp.status_code in _RETRY.status_forcelist and attempt < _RETRY.total:
+                    retry_after = resp.headers.get("Retry-After")
+                elif resp.is_success:
+                    body, fast = _read_body(resp.iter_bytes(65536), resp.encoding)
+                    return resp, body, fast
+                else:
+                    return resp, b"", None
+            finally:
+                resp.close()
+        except httpx.TransportError:
+            if attempt >= _RETRY.total:
+                raise
+        time.sleep(_retry_delay(attempt, retry_after))
+        attempt += 1
+
+def _read_body(chunks: Iterable[bytes], encoding: str = "utf-8") -> Tuple[bytes, Optional[Tuple[Set[str], str]]]:
+    """
+    レスポンス本文を最大 MAX_BODY_BYTES まで読み込み、(本文, (JSON-LD のタグ, og:title) or None) を返す。
+    HTML パーサを使わず、チャンクを受け取るたびに前回の続きから正規表現で探し、
+    両方そろった時点で打ち切る（残りは受信しない）。どちらかが取れなければ None（通常のパースにフォールバック）。
+    encoding はページの文字コード（応答の charset。DOM 側のパースと同じもの）。
+    """
+    buf = bytearray()
+    tags: Set[str] = set()
+    title: Optional[str] = None
+    jsonld_pos = 0  # JSON-LD を次に探し始める位置
+    title_pos = 0   # og:title を次に探し始める位置
+    for chunk in chunks:
+        buf.extend(chunk)
+        full = len(buf) >= MAX_BODY_BYTES
+        if full:
+            del buf[MAX_BODY_BYTES:]
+        if not tags:
+            tags, jsonld_pos = _scan_jsonld(buf, jsonld_pos, encoding)
+        if title is None:
+            title, title_pos = _scan_og_title(buf, title_pos, encoding)
+        if (tags and title is not None) or full:
+            break
+    return bytes(buf), ((tags, title) if tags and title is not None else None)
+
+def fetch_tags(video_id: str, prev: Optional[Dict] = None) -> Tuple[Set[str], Dict]:
     """
     現在のタグ集合とメタ情報を返す。
     複数の手段でタグ抽出（JSON-LD / meta keywords / 画面の候補）
+    prev（前回の state[video_id]）に ETag / Last-Modified があれば条件付き GET を行い、
+    304 または本文ハッシュが前回と同じなら前回のタグをそのまま返す。
     """
+    prev = prev or {}
     url = f"https://www.nicovideo.jp/watch/{video_id}"
-    resp = requests.get(url, headers=DEFAULT_HEADERS, timeout=20)
+    headers = {}
+    # 304 で返せるタグが手元にあるときだけ条件付きにする
+    # （state.json だけ消えて state.meta.json が残った場合に空のタグを返さないため）
+    if "tags" in prev:
+        if prev.get("etag"):
+            headers["If-None-Match"] = prev["etag"]
+        if prev.get("last_modified"):
+            headers["If-Modified-Since"] = prev["last_modified"]
+
+    resp, body, fast = _get_with_retry(url, headers)
+    if resp.status_code == 304:
+        logging.debug("%s: 304 Not Modified", video_id)
+        return set(prev["tags"]), {
+            "url": url,
+            "title": prev.get("title"),
+            "etag": resp.headers.get("ETag") or prev.get("etag"),
+            "last_modified": resp.headers.get("Last-Modified") or prev.get("last_modified"),
+            "body_sha256": prev.get("body_sha256"),
+        }
     resp.raise_for_status()
-    soup = BeautifulSoup(resp.text, "html.parser")
+    logging.debug("%s: content-encoding=%s", video_id, resp.headers.get("Content-Encoding"))
+
+    metadata: Dict = {
+        "url": url,
+        "title": None,
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "body_sha256": hashlib.sha256(body).hexdigest(),
+    }
+
+    # 本文が前回とまったく同じならパースせず前回のタグを使う
+    if prev.get("tags") is not None and metadata["body_sha256"] == prev.get("body_sha256"):
+        logging.debug("%s: 本文ハッシュ一致", video_id)
+        metadata["title"] = prev.get("title")
+        return set(prev["tags"]), metadata
+
+    # 高速経路: 読み込み中に JSON-LD と og:title が取れていれば DOM を組み立てない
+    if fast:
+        tags, metadata["title"] = fast
+        return tags, metadata
+
+    # lexbor はバイト列を UTF-8 としてそのまま読めるので、UTF-8 以外と明示された場合だけ先にデコードする
+    # （resp.encoding は charset 未指定・不明なら utf-8）
+    if codecs.lookup(resp.encoding).name == "utf-8":
+        tree = LexborHTMLParser(body)
+    else:
+        tree = LexborHTMLParser(body.decode(resp.encoding, errors="replace"))
 
     tags: Set[str] = set()
-    metadata: Dict = {"url": url, "title": None}
 
-    # タイトル
-    title_el = soup.find("meta", property="og:title") or soup.find("title")
-    if title_el:
-        try:
-            # meta/og:title は content 属性、title タグはテキスト
-            metadata["title"] = title_el.get("content") if hasattr(title_el, "get") and title_el.get("content") else title_el.text.strip()
-        except Exception:
-            metadata["title"] = video_id
+    # タイトル（og:title は content 属性、title タグはテキスト）
+    og_title = tree.css_first(_OG_TITLE_SELECTOR)
+    if og_title and og_title.attributes.get("content"):
+        metadata["title"] = og_title.attributes.get("content")
+    else:
+        title_el = tree.css_first("title")
+        if title_el:
+            metadata["title"] = title_el.text().strip()
 
-    # Strategy 1: JSON-LD keywords
-    for s in soup.find_all("script", type="application/ld+json"):
+    # Strategy 1: JSON-LD keywords（keywords を持つ最初のブロックだけ使う）
+    for s in tree.css(_JSONLD_SELECTOR):
         try:
-            data = json.loads(s.string or "")
-            if isinstance(data, dict) and "keywords" in data:
-                kw = data["keywords"]
-                if isinstance(kw, list):
-                    tags.update([str(x).strip() for x in kw if str(x).strip()])
-                elif isinstance(kw, str):
-                    tags.update([t.strip() for t in kw.split(",") if t.strip()])
+            tags = _jsonld_keywords(json.loads(s.text() or ""))
         except Exception:
             # JSON-LDが壊れていても無視
-            pass
+            continue
+        if tags:
+            break
 
     # Strategy 2: meta keywords
     if not tags:
-        try:
-            meta_kw = soup.find("meta", attrs={"name": "keywords"})
-            if meta_kw and meta_kw.get("content"):
-                tags.update([t.strip() for t in meta_kw.get("content").split(",") if t.strip()])
-        except Exception:
-            pass
+        meta_kw = tree.css_first(_META_KW_SELECTOR)
+        content = meta_kw.attributes.get("content") if meta_kw else None
+        if content:
+            tags.update([t.strip() for t in content.split(",") if t.strip()])
 
     # Strategy 3: visible tag links (fallback)
     if not tags:
-        try:
-            candidates = soup.select('a[data-tag], li a[href*="/tag/"], span.TagContainer-tag')
-            for a in candidates:
-                txt = (a.get("data-tag") or a.get_text() or "").strip()
-                if txt:
-                    tags.add(txt)
-        except Exception:
-            pass
+        for a in tree.css(_TAG_SELECTOR):
+            txt = (a.attributes.get("data-tag") or a.text() or "").strip()
+            if txt:
+                tags.add(txt)
 
     tags = {t.strip() for t in tags if t.strip()}
     return tags, metadata
 
+def check_one(video_id: str, prev: Dict) -> Tuple[str, Set[str], Dict, Optional[BaseException]]:
+    """
+    ワーカースレッドで1動画分のタグを取得する。
+    例外は投げずに返し、集約側（main）でまとめて扱う。
+    """
+    try:
+        now_tags, meta = fetch_tags(video_id, prev)
+        return video_id, now_tags, meta, None
+    except Exception as e:
+        return video_id, set(), {}, e
+
 # -------------------- 通知 --------------------
 
 def notify_discord(message: str) -> bool:
@@ -132,7 +454,7 @@ def notify_discord(message: str) -> bool:
     if not url:
         return False
     try:
-        r = requests.post(url, json={"content": message}, timeout=15)
+        r = _SESSION.post(url, json={"content": message}, timeout=15)
         return 200 <= r.status_code < 300
     except Exception:
         return False
@@ -142,44 +464,91 @@ def notify_teams(message: str) -> bool:
     if not url:
         return False
     try:
-        r = requests.post(url, json={"text": message}, timeout=15)
+        r = _SESSION.post(url, json={"text": message}, timeout=15)
         return 200 <= r.status_code < 300
     except Exception:
         return False
 
+def _is_rejected(status_code: int) -> bool:
+    """まとめ送信がペイロードごと拒否された（4xx、ただし 429 を除く）か。"""
+    return 400 <= status_code < 500 and status_code != 429
+
+def chunk_messages(messages: List[str]) -> Iterator[List[str]]:
+    """Discord の制限（1回 embed 10件・合計 6000 文字）に収まるよう通知をまとめる。"""
+    batch: List[str] = []
+    size = 0
+    for msg in messages:
+        msg = msg[:DISCORD_EMBED_DESC_MAX]
+        if batch and (len(batch) >= DISCORD_MAX_EMBEDS or size + len(msg) > DISCORD_MAX_EMBED_CHARS):
+            yield batch
+            batch, size = [], 0
+        batch.append(msg)
+        size += len(msg)
+    if batch:
+        yield batch
+
+def notify_discord_batch(messages: List[str]) -> List[str]:
+    """
+    複数の通知を embed にして1回で送る。拒否されたら1件ずつ送り直す。
+    届かなかったメッセージを返す（すべて届けば空リスト）。
+    """
+    url = os.getenv("DISCORD_WEBHOOK_URL")
+    if not url:
+        return messages
+    try:
+        r = _SESSION.post(url, json={"embeds": [{"description": m} for m in messages]}, timeout=15)
+    except Exception:
+        return messages
+    if _is_rejected(r.status_code):
+        return [m for m in messages if not notify_discord(m)]
+    return [] if 200 <= r.status_code < 300 else messages
+
+def notify_teams_batch(messages: List[str]) -> List[str]:
+    """
+    複数の通知をカードのセクションにして1回で送る。拒否されたら1件ずつ送り直す。
+    届かなかったメッセージを返す（すべて届けば空リスト）。
+    """
+    url = os.getenv("TEAMS_WEBHOOK_URL")
+    if not url:
+        return messages
+    card = {
+        "@type": "MessageCard",
+        "@context": "http://schema.org/extensions",
+        "summary": "NicoNico Tag Monitor",
+        "sections": [{"text": m} for m in messages],
+    }
+    try:
+        r = _SESSION.post(url, json=card, timeout=15)
+    except Exception:
+        return messages
+    if _is_rejected(r.status_code):
+        return [m for m in messages if not notify_teams(m)]
+    return [] if 200 <= r.status_code < 300 else messages
+
 # -------------------- メッセージ整形 --------------------
 
-def format_deleted_message(video_id: str, meta: Dict, removed: Set[str], now_tags: Set[str]) -> str:
+def _bullets(tags: Set[str]) -> str:
+    return "・" + " ・".join(sorted(tags)) if tags else "（なし）"
+
+def format_deleted_message(video_id: str, meta: Dict, removed: Set[str], now_tags: Set[str], detected_at: str) -> str:
     title = meta.get("title") or video_id
-    url = meta.get("url")
-    lines = [
-        f"【タグ削除検知】{title} ({video_id})",
-        f"{url}",
-        "消されたタグ:",
-        "・" + " ・".join(sorted(removed)) if removed else "（なし）",
-        "",
-        "現在のタグ:",
-        "・" + " ・".join(sorted(now_tags)) if now_tags else "（なし）",
-        "",
-        f"検知時刻: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())}"
-    ]
-    return "\n".join(lines)
-
-def format_missing_required_message(video_id: str, meta: Dict, missing: Set[str], now_tags: Set[str]) -> str:
+    return (
+        f"【タグ削除検知】{title} ({video_id})\n"
+        f"{meta.get('url')}\n"
+        f"消されたタグ:\n{_bullets(removed)}\n\n"
+        f"現在のタグ:\n{_bullets(now_tags)}\n\n"
+        f"検知時刻: {detected_at}"
+    )
+
+def format_missing_required_message(video_id: str, meta: Dict, missing: Set[str], now_tags: Set[str], detected_at: str) -> str:
     title = meta.get("title") or video_id
-    url = meta.get("url")
-    lines = [
-        f"【必須タグ欠落】{title} ({video_id})",
-        f"{url}",
-        "不足している必須タグ:",
-        "・" + " ・".join(sorted(missing)),
-        "",
-        "現在のタグ:",
-        "・" + " ・".join(sorted(now_tags)) if now_tags else "（なし）",
-        "",
-        f"検知時刻: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())}"
-    ]
-    return "\n".join(lines)
+    return (
+        f"【必須タグ欠落】{title} ({video_id})\n"
+        f"{meta.get('url')}\n"
+        f"不足している必須タグ:\n{_bullets(missing)}\n\n"
+        f"現在のタグ:\n{_bullets(now_tags)}\n\n"
+        f"検知時刻: {detected_at}"
+    )
 
 # -------------------- メイン --------------------
 
@@ -198,52 +567,74 @@ def main():
         return 2
 
     state_path = Path(args.state)
-    state = load_state(state_path)
+    # 変更がなければ保存を省くため、読み込んだファイルの中身も控えておく
+    state, old_bytes = load_state(state_path)
 
     now_ts = int(time.time())
+    # 1回の実行内の通知はすべて同じ検知時刻にする
+    detected_at = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now_ts))
     exit_code = 0
+    pending: List[Tuple[int, str]] = []  # この実行で送る通知（video_ids 内の順番, メッセージ）
+    order = {vid: i for i, vid in enumerate(video_ids)}
 
-    for vid in video_ids:
-        try:
-            now_tags, meta = fetch_tags(vid)
-
-            # -------- 1) 削除検知（従来機能） --------
-            prev = set(state.get(vid, {}).get("tags", []))
-            removed = prev - now_tags if prev else set()
-            if removed:
-                msg = format_deleted_message(vid, meta, removed, now_tags)
-                sent = notify_discord(msg) or notify_teams(msg)
-                if not sent:
-                    logging.warning("削除通知の送信に失敗（Discord/Teamsの設定を確認）")
-
-            # -------- 2) 必須タグ検知（毎回通知版） --------
-            missing_required = set()
-            if required:
-                # 大文字小文字の違いなどを吸収したい場合は正規化を検討（日本語タグ想定なのでそのまま一致）
-                missing_required = required - now_tags
-                if missing_required:
-                    msg = format_missing_required_message(vid, meta, missing_required, now_tags)
-                    sent = notify_discord(msg) or notify_teams(msg)
-                    if not sent:
-                        logging.warning("必須タグ欠落の通知送信に失敗（Discord/Teamsの設定を確認）")
-
-                # 次回比較用に保存（今は毎回通知なので参照はしないが、将来拡張用に保持）
-                state.setdefault(vid, {})["last_missing_required"] = sorted(list(missing_required))
-
-            # タグの最新状態も保存（削除検知用）
-            state.setdefault(vid, {})
-            state[vid]["tags"] = sorted(list(now_tags))
-            state[vid]["title"] = meta.get("title")
-            state[vid]["last_checked"] = now_ts
-            save_state(state_path, state)
-
-            if not removed and not missing_required:
-                logging.info("異常なし: %s", vid)
-
-        except Exception:
-            logging.exception("チェック失敗: %s", vid)
-            exit_code = 2
-
+    # 取得は並列、状態更新と通知はこのスレッドで完了順に処理する
+    try:
+        with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(video_ids))) as pool:
+            futures = [pool.submit(check_one, vid, dict(state.get(vid, {}))) for vid in video_ids]
+            for fut in as_completed(futures):
+                vid, now_tags, meta, exc = fut.result()
+                if exc is not None:
+                    logging.error("チェック失敗: %s", vid, exc_info=exc)
+                    exit_code = 2
+                    continue
+                try:
+                    # -------- 1) 削除検知（従来機能） --------
+                    prev = set(state.get(vid, {}).get("tags", []))
+                    removed = prev - now_tags if prev else set()
+                    if removed:
+                        pending.append((order[vid], format_deleted_message(vid, meta, removed, now_tags, detected_at)))
+
+                    # -------- 2) 必須タグ検知（毎回通知版） --------
+                    missing_required = set()
+                    if required:
+                        # 大文字小文字の違いなどを吸収したい場合は正規化を検討（日本語タグ想定なのでそのまま一致）
+                        missing_required = required - now_tags
+                        if missing_required:
+                            pending.append((order[vid], format_missing_required_message(vid, meta, missing_required, now_tags, detected_at)))
+
+                        # 次回比較用に保存（今は毎回通知なので参照はしないが、将来拡張用に保持）
+                        state.setdefault(vid, {})["last_missing_required"] = sorted(list(missing_required))
+
+                    # タグの最新状態も保存（削除検知用）
+                    state.setdefault(vid, {})
+                    state[vid]["tags"] = sorted(list(now_tags))
+                    state[vid]["title"] = meta.get("title")
+                    state[vid]["last_checked"] = now_ts
+                    # 次回の条件付き GET 用
+                    state[vid]["etag"] = meta.get("etag")
+                    state[vid]["last_modified"] = meta.get("last_modified")
+                    state[vid]["body_sha256"] = meta.get("body_sha256")
+
+                    if not removed and not missing_required:
+                        logging.info("異常なし: %s", vid)
+
+                except Exception:
+                    logging.exception("チェック失敗: %s", vid)
+                    exit_code = 2
+
+        # 通知は実行ごとにまとめて送る。取得の完了順ではなく video_ids の順に並べる。
+        # Discord に届かなかった分だけ Teams に回す
+        messages = [msg for _, msg in sorted(pending, key=lambda p: p[0])]
+        for batch in chunk_messages(messages):
+            unsent = notify_discord_batch(batch)
+            if unsent:
+                unsent = notify_teams_batch(unsent)
+            if unsent:
+                logging.warning("通知の送信に失敗（Discord/Teamsの設定を確認）: %d件", len(unsent))
+    finally:
+        # 途中で失敗しても処理済みの分は保存する（書き込みは1回のみ）
+        if not save_state(state_path, state, old_bytes):
+            logging.info("state に変更なし（保存をスキップ）")
     return exit_code
 
 